@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 """
 Scrape Illinois Extension "Stain Solutions" from the archived index page.
-- Crawls the Wayback snapshot index to collect all stain detail links.
+- Crawls one or more Wayback snapshot indexes to collect all stain detail links into an
+  on-disk crawl frontier (SQLite) that dedupes by original URL; --resume continues it.
 - Visits each archived detail page and extracts ONLY content inside #container > #content
   (with sensible fallbacks if the exact container isn't present).
 - Handles multiple methods per fabric (split by an <h4> "Or").
@@ -12,9 +13,11 @@ Scrape Illinois Extension "Stain Solutions" from the archived index page.
 import argparse
 import csv
 import json
+import os
 import re
+import sqlite3
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from urllib.parse import urljoin, unquote
 
 import requests
@@ -224,18 +227,27 @@ def parse_detail_page(html: str, archive_url: str, original_url: str) -> Optiona
 # ----------------------------
 # Fetching / networking
 # ----------------------------
-def fetch(url: str, session: requests.Session, timeout: int = 40, retries: int = 3, backoff: float = 1.0) -> Optional[str]:
+def fetch_page(url: str, session: requests.Session, timeout: int = 40, retries: int = 3,
+               backoff: float = 1.0) -> Tuple[Optional[str], bool]:
+    """
+    Return (html, gone). `gone` is True only when the server answered 404/410, i.e. the
+    failure is permanent; timeouts, 5xx/429 and empty bodies after all retries are not.
+    """
     for attempt in range(1, retries + 1):
         try:
             r = session.get(url, headers=HEADERS, timeout=timeout, allow_redirects=True)
             if r.status_code == 200 and r.text:
-                return r.text
+                return r.text, False
             if r.status_code in (404, 410):
-                return None
+                return None, True
         except requests.RequestException:
             pass
         time.sleep(backoff * attempt)
-    return None
+    return None, False
+
+
+def fetch(url: str, session: requests.Session, timeout: int = 40, retries: int = 3, backoff: float = 1.0) -> Optional[str]:
+    return fetch_page(url, session, timeout, retries, backoff)[0]
 
 
 # ----------------------------
@@ -301,16 +313,14 @@ def is_detail_href(href: str) -> bool:
     return ("staindetail.cfm" in href) or ("staindetail.cfm" in dec)
 
 
-def collect_detail_links(index_html: str, index_url: str) -> List[Dict[str, str]]:
+def iter_detail_links(index_html: str, index_url: str) -> Iterator[Dict[str, str]]:
     """
-    Parse ALL <a> tags in the index snapshot, normalize to (archive_url, original_url),
-    and return de-duplicated links to stain detail pages.
+    Parse ALL <a> tags in the index snapshot and yield links to stain detail pages,
+    normalized to (archive_url, original_url). No de-duplication happens here —
+    that is the caller's (or the crawl frontier's) job.
     """
     soup = BeautifulSoup(index_html, "html.parser")
 
-    links: List[Dict[str, str]] = []
-    seen = set()
-
     # We search ALL anchors to avoid missing anything due to strict container selection.
     for a in soup.find_all("a", href=True):
         href = a["href"].strip()
@@ -321,20 +331,245 @@ def collect_detail_links(index_html: str, index_url: str) -> List[Dict[str, str]
         if not arch or not orig:
             continue
 
-        if orig in seen:
-            continue
-        seen.add(orig)
-
-        links.append({
+        yield {
             "name": text_of(a).strip(),
             "archive_url": arch,
             "original_url": orig
-        })
+        }
+
+
+def collect_detail_links(index_html: str, index_url: str) -> List[Dict[str, str]]:
+    """
+    Parse ALL <a> tags in the index snapshot, normalize to (archive_url, original_url),
+    and return de-duplicated links to stain detail pages.
+    """
+    links: List[Dict[str, str]] = []
+    seen = set()
+
+    for link in iter_detail_links(index_html, index_url):
+        if link["original_url"] in seen:
+            continue
+        seen.add(link["original_url"])
+        links.append(link)
 
     print(f"Collected {len(links)} detail links from index.")
     return links
 
 
+# ----------------------------
+# Persistent crawl frontier
+# ----------------------------
+class CrawlFrontier:
+    """
+    On-disk crawl queue + visited store, backed by SQLite so it survives restarts.
+
+    - Every detail link is keyed by its canonical `original_url` (a UNIQUE column), so
+      de-duplication across any number of index snapshots is a single indexed lookup
+      and the full link list never has to be held in memory.
+    - Every archive capture of a link is kept in `link_sources`, so when one snapshot's
+      capture is missing or unparsable the next one can be tried.
+    - Each link carries a priority (lower = fetched first). A link discovered from
+      several seeds keeps the best (lowest) priority it was seen with.
+    - Status moves from "pending" to "ok", "skip" (no capture parsed), "miss" (every
+      capture is gone, or too many failed attempts) or "error" (temporary failure,
+      requeued on the next run). Only "pending" links are handed out.
+    - Seed index URLs are recorded too, so a resumed run does not re-expand them.
+    """
+
+    PENDING = "pending"
+
+    def __init__(self, path: str, batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS links (
+                seq          INTEGER PRIMARY KEY,
+                original_url TEXT NOT NULL UNIQUE,
+                name         TEXT NOT NULL DEFAULT '',
+                priority     INTEGER NOT NULL DEFAULT 0,
+                status       TEXT NOT NULL DEFAULT 'pending',
+                attempts     INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS links_queue ON links (status, priority, seq);
+            CREATE TABLE IF NOT EXISTS link_sources (
+                original_url TEXT NOT NULL,
+                archive_url  TEXT NOT NULL,
+                priority     INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (original_url, archive_url)
+            );
+            CREATE TABLE IF NOT EXISTS seeds (
+                index_url TEXT PRIMARY KEY,
+                expanded  INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "CrawlFrontier":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def reset(self):
+        """Forget every link, capture and seed (start a fresh crawl)."""
+        self.conn.executescript("""
+            DELETE FROM links;
+            DELETE FROM link_sources;
+            DELETE FROM seeds;
+        """)
+        self.conn.commit()
+
+    # -- seeds --
+    def seed_expanded(self, index_url: str) -> bool:
+        row = self.conn.execute("SELECT expanded FROM seeds WHERE index_url = ?", (index_url,)).fetchone()
+        return bool(row and row[0])
+
+    def mark_seed_expanded(self, index_url: str):
+        self.conn.execute(
+            "INSERT INTO seeds (index_url, expanded) VALUES (?, 1) "
+            "ON CONFLICT(index_url) DO UPDATE SET expanded = 1",
+            (index_url,)
+        )
+        self.conn.commit()
+
+    # -- queue --
+    def add_links(self, links: Iterable[Dict[str, str]], priority: int = 0) -> int:
+        """
+        Enqueue links in batches. Already-known URLs are not duplicated, but their new
+        archive capture is recorded; a pending link is bumped to `priority` if that is
+        better than what it had, and a finished-but-unsuccessful link is requeued.
+        Returns the number of links that were new to the frontier.
+        """
+        inserted, batch = 0, []
+        for link in links:
+            batch.append((link["original_url"], link["archive_url"], link.get("name", "")))
+            if len(batch) >= self.batch_size:
+                inserted += self._insert_batch(batch, priority)
+                batch = []
+        if batch:
+            inserted += self._insert_batch(batch, priority)
+        self.conn.commit()
+        return inserted
+
+    def _insert_batch(self, batch: List[tuple], priority: int) -> int:
+        """Stage a batch in a temp table, then apply it with set-based statements."""
+        self.conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS batch (original_url TEXT, archive_url TEXT, name TEXT)"
+        )
+        self.conn.execute("DELETE FROM batch")
+        self.conn.executemany("INSERT INTO batch (original_url, archive_url, name) VALUES (?, ?, ?)", batch)
+
+        # Known links that got a capture we have not seen: another snapshot may have
+        # what the earlier captures lacked, so put finished-but-unsuccessful ones back
+        self.conn.execute(
+            "UPDATE links SET status = 'pending', attempts = 0 "
+            "WHERE status IN ('miss', 'skip', 'error') AND original_url IN ("
+            "  SELECT b.original_url FROM batch b WHERE NOT EXISTS ("
+            "    SELECT 1 FROM link_sources s"
+            "    WHERE s.original_url = b.original_url AND s.archive_url = b.archive_url))"
+        )
+        self.conn.execute(
+            "UPDATE links SET priority = ? "
+            "WHERE status = 'pending' AND priority > ? AND original_url IN (SELECT original_url FROM batch)",
+            (priority, priority)
+        )
+        # New links, in discovery order; SQLite takes `name` from the MIN(rowid) row
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO links (original_url, name, priority) "
+            "SELECT original_url, name, ? FROM ("
+            "  SELECT original_url, name, MIN(rowid) AS first FROM batch GROUP BY original_url"
+            ") ORDER BY first",
+            (priority,)
+        )
+        inserted = cur.rowcount
+        self.conn.execute(
+            "INSERT OR IGNORE INTO link_sources (original_url, archive_url, priority) "
+            "SELECT original_url, archive_url, ? FROM batch ORDER BY rowid",
+            (priority,)
+        )
+        return inserted
+
+    def requeue(self, statuses: Iterable[str]) -> int:
+        """
+        Put links with any of `statuses` back to "pending". Attempt counts are kept for
+        "error" (so max_attempts still applies) and reset for everything else.
+        """
+        statuses = list(statuses)
+        if not statuses:
+            return 0
+        marks = ", ".join("?" for _ in statuses)
+        cur = self.conn.execute(
+            "UPDATE links SET status = 'pending', "
+            "attempts = CASE WHEN status = 'error' THEN attempts ELSE 0 END "
+            f"WHERE status IN ({marks})",
+            statuses
+        )
+        self.conn.commit()
+        return cur.rowcount
+
+    def sources(self, original_url: str) -> List[str]:
+        """All known archive captures of a link, best priority first."""
+        rows = self.conn.execute(
+            "SELECT archive_url FROM link_sources WHERE original_url = ? ORDER BY priority, rowid",
+            (original_url,)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def pending(self) -> Iterator[Dict[str, Any]]:
+        """
+        Stream pending links in priority order, one batch at a time. The cursor moves
+        forward whether or not a link gets marked; a link left unmarked simply stays
+        "pending" and is handed out again on the next run.
+        """
+        last = (-1 << 62, -1)
+        while True:
+            rows = self.conn.execute(
+                "SELECT priority, seq, name, original_url FROM links "
+                "WHERE status = ? AND (priority, seq) > (?, ?) "
+                "ORDER BY priority, seq LIMIT ?",
+                (self.PENDING, last[0], last[1], self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for priority, seq, name, orig in rows:
+                last = (priority, seq)
+                archive_urls = self.sources(orig)
+                yield {
+                    "seq": seq,
+                    "name": name,
+                    "archive_url": archive_urls[0] if archive_urls else "",
+                    "archive_urls": archive_urls,
+                    "original_url": orig
+                }
+
+    def mark(self, original_url: str, status: str):
+        self.conn.execute("UPDATE links SET status = ? WHERE original_url = ?", (status, original_url))
+        self.conn.commit()
+
+    def mark_error(self, original_url: str, max_attempts: int) -> str:
+        """Record a temporary failure; give up ("miss") after `max_attempts`. Returns the new status."""
+        self.conn.execute(
+            "UPDATE links SET attempts = attempts + 1, "
+            "status = CASE WHEN attempts + 1 >= ? THEN 'miss' ELSE 'error' END "
+            "WHERE original_url = ?",
+            (max_attempts, original_url)
+        )
+        self.conn.commit()
+        row = self.conn.execute("SELECT status FROM links WHERE original_url = ?", (original_url,)).fetchone()
+        return row[0] if row else "miss"
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            return self.conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM links WHERE status = ?", (status,)).fetchone()[0]
+
+
 # ----------------------------
 # Output shaping
 # ----------------------------
@@ -374,9 +609,12 @@ def flatten_for_csv(record: Dict[str, Any], idx: int) -> List[Dict[str, Any]]:
 # ----------------------------
 # Main scrape routine
 # ----------------------------
-def scrape_from_index(index_url: str, sleep_s: float, out_prefix: str, limit: Optional[int] = None):
+def scrape_from_indexes(index_urls: List[str], sleep_s: float, out_prefix: str,
+                        limit: Optional[int] = None, frontier_path: Optional[str] = None,
+                        max_attempts: int = 3, requeue: Optional[List[str]] = None, resume: bool = False):
     jsonl_path = f"{out_prefix}.jsonl"
     csv_path = f"{out_prefix}.csv"
+    frontier_path = frontier_path or f"{out_prefix}.frontier.sqlite"
     fieldnames = [
         "row_id", "stain_title", "section", "method_index",
         "materials", "steps", "method_notes", "method_cautions",
@@ -386,73 +624,124 @@ def scrape_from_index(index_url: str, sleep_s: float, out_prefix: str, limit: Op
     ]
 
     session = requests.Session()
-
-    # 1) Fetch index
-    idx_html = fetch(index_url, session)
-    if not idx_html:
-        raise SystemExit(f"Could not fetch index: {index_url}")
-
-    # 2) Collect links
-    detail_links = collect_detail_links(idx_html, index_url)
-    if not detail_links:
-        raise SystemExit("No detail links found on the index page.")
-
-    if limit is not None:
-        detail_links = detail_links[:limit]
-
-    print(f"Found {len(detail_links)} stain links on index.")
-
-    total_ok = 0
-    with open(jsonl_path, "w", encoding="utf-8") as jf, \
-         open(csv_path, "w", newline="", encoding="utf-8") as cf:
-
-        writer = csv.DictWriter(cf, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for i, link in enumerate(detail_links, start=1):
-            arch = link["archive_url"]
-            orig = link["original_url"]
-            html = fetch(arch, session)
-            if not html:
-                print(f"[MISS] {i}/{len(detail_links)} {orig}")
-                time.sleep(sleep_s)
+    with CrawlFrontier(frontier_path) as frontier:
+        # 0) Without --resume, start from scratch so a re-run regenerates the full outputs
+        have_outputs = os.path.exists(jsonl_path) and os.path.exists(csv_path)
+        if resume and frontier.count("ok") and not have_outputs:
+            raise SystemExit(f"Frontier {frontier_path} has finished links but {jsonl_path}/{csv_path} "
+                             "are missing; re-run without --resume to regenerate everything.")
+        if not resume or not have_outputs:
+            # Truncate the outputs BEFORE resetting the frontier: if the run dies in between,
+            # a later --resume may lose records (fixed by a fresh run) but never duplicates them.
+            with open(jsonl_path, "w", encoding="utf-8"), \
+                 open(csv_path, "w", newline="", encoding="utf-8") as cf:
+                csv.DictWriter(cf, fieldnames=fieldnames).writeheader()
+        if not resume:
+            frontier.reset()
+
+        # 1) Expand every seed index into the frontier (earlier seeds get higher priority)
+        for priority, index_url in enumerate(index_urls):
+            if frontier.seed_expanded(index_url):
+                print(f"[SEED] {index_url} already expanded, skipping.")
                 continue
-
-            record = parse_detail_page(html, arch, orig)
-            if not record:
-                print(f"[SKIP] {i}/{len(detail_links)} {orig} (no structured content)")
-                time.sleep(sleep_s)
+            idx_html = fetch(index_url, session)
+            if not idx_html:
+                print(f"[MISS] Could not fetch index: {index_url}")
                 continue
-
-            # JSONL: one full record per stain
-            jf.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-            # CSV: one row per method
-            rows = flatten_for_csv(record, i)
-            if not rows:
-                # Minimal fallback row
-                rows = [{
-                    "row_id": f"{i}-1",
-                    "stain_title": record.get("title", ""),
-                    "section": "",
-                    "method_index": 1,
-                    "materials": "",
-                    "steps": "",
-                    "method_notes": " | ".join(record.get("intro_notes", [])),
-                    "method_cautions": " | ".join(record.get("cautions", [])),
-                    "intro_notes": " | ".join(record.get("intro_notes", [])),
-                    "top_cautions": " | ".join(record.get("cautions", [])),
-                    "source_archive_url": arch,
-                    "source_original_url": orig,
-                    "extra": " | ".join(record.get("extra", []))
-                }]
-            for row in rows:
-                writer.writerow(row)
-
-            total_ok += 1
-            print(f"[OK]  {i}/{len(detail_links)} {record.get('title','(no title)')} -> {len(rows)} row(s)")
+            added = frontier.add_links(iter_detail_links(idx_html, index_url), priority=priority)
+            frontier.mark_seed_expanded(index_url)
+            print(f"[SEED] {index_url} -> {added} new detail link(s).")
             time.sleep(sleep_s)
 
+        if not frontier.count():
+            raise SystemExit("No detail links found on any index page.")
+
+        # Temporary failures from earlier runs are always retried; misses/skips only on request
+        requeued = frontier.requeue(["error"] + list(requeue or []))
+        if requeued:
+            print(f"Requeued {requeued} link(s) from earlier runs.")
+
+        # 2) Outputs exist (with CSV header) by now; always append to them
+        pending_total = frontier.count(CrawlFrontier.PENDING)
+        if limit is not None:
+            pending_total = min(pending_total, limit)
+
+        print(f"Frontier: {frontier.count()} stain links, {pending_total} to fetch this run.")
+
+        total_ok = 0
+        with open(jsonl_path, "a", encoding="utf-8") as jf, \
+             open(csv_path, "a", newline="", encoding="utf-8") as cf:
+
+            writer = csv.DictWriter(cf, fieldnames=fieldnames)
+
+            for n, link in enumerate(frontier.pending(), start=1):
+                if limit is not None and n > limit:
+                    break
+                i = link["seq"]  # stable per link, so row_ids never collide across resumed runs
+                orig = link["original_url"]
+                record, arch, fetched, transient = None, link["archive_url"], False, False
+
+                # Try each snapshot's capture in priority order until one parses
+                for c, arch in enumerate(link["archive_urls"]):
+                    if c:
+                        time.sleep(sleep_s)
+                    html, gone = fetch_page(arch, session)
+                    if not html:
+                        transient = transient or not gone
+                        continue
+                    fetched = True
+                    record = parse_detail_page(html, arch, orig)
+                    if record:
+                        break
+
+                if not record:
+                    if transient:
+                        status = frontier.mark_error(orig, max_attempts)
+                        label = "[RETRY]" if status == "error" else "[MISS]"
+                        print(f"{label} {n}/{pending_total} {orig} (temporary failure)")
+                    elif fetched:
+                        print(f"[SKIP] {n}/{pending_total} {orig} (no structured content)")
+                        frontier.mark(orig, "skip")
+                    else:
+                        print(f"[MISS] {n}/{pending_total} {orig}")
+                        frontier.mark(orig, "miss")
+                    time.sleep(sleep_s)
+                    continue
+
+                # JSONL: one full record per stain
+                jf.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+                # CSV: one row per method
+                rows = flatten_for_csv(record, i)
+                if not rows:
+                    # Minimal fallback row
+                    rows = [{
+                        "row_id": f"{i}-1",
+                        "stain_title": record.get("title", ""),
+                        "section": "",
+                        "method_index": 1,
+                        "materials": "",
+                        "steps": "",
+                        "method_notes": " | ".join(record.get("intro_notes", [])),
+                        "method_cautions": " | ".join(record.get("cautions", [])),
+                        "intro_notes": " | ".join(record.get("intro_notes", [])),
+                        "top_cautions": " | ".join(record.get("cautions", [])),
+                        "source_archive_url": arch,
+                        "source_original_url": orig,
+                        "extra": " | ".join(record.get("extra", []))
+                    }]
+                for row in rows:
+                    writer.writerow(row)
+
+                # Flush outputs before marking, so a crash never loses a record marked as done
+                jf.flush()
+                cf.flush()
+                frontier.mark(orig, "ok")
+
+                total_ok += 1
+                print(f"[OK]  {n}/{pending_total} {record.get('title','(no title)')} -> {len(rows)} row(s)")
+                time.sleep(sleep_s)
+
     print(f"Done. Parsed {total_ok} stains with content.")
     print(f"Wrote: {jsonl_path} and {csv_path}")
 
@@ -461,16 +750,30 @@ def scrape_from_index(index_url: str, sleep_s: float, out_prefix: str, limit: Op
 # CLI
 # ----------------------------
 def main():
-    ap = argparse.ArgumentParser(description="Scrape Illinois Extension Stain Solutions via archived index.")
-    ap.add_argument("--index", type=str, required=True,
-                    help="Wayback snapshot URL of the index page, e.g. "
-                         "https://web.archive.org/web/20201127204719/https://web.extension.illinois.edu/stain/index.cfm")
+    ap = argparse.ArgumentParser(description="Scrape Illinois Extension Stain Solutions via archived indexes.")
+    ap.add_argument("--index", type=str, action="append", required=True,
+                    help="Wayback snapshot URL of an index page, e.g. "
+                         "https://web.archive.org/web/20201127204719/https://web.extension.illinois.edu/stain/index.cfm "
+                         "(repeat to union several snapshots/indexes; earlier ones are fetched first)")
     ap.add_argument("--sleep", type=float, default=0.6, help="Seconds to sleep between requests")
     ap.add_argument("--out-prefix", type=str, default="stain_solutions", help="Output filename prefix")
     ap.add_argument("--limit", type=int, default=None, help="Optional limit for quick tests")
+    ap.add_argument("--frontier", type=str, default=None,
+                    help="Crawl frontier database (default: <out-prefix>.frontier.sqlite)")
+    ap.add_argument("--resume", action="store_true",
+                    help="Continue the crawl stored in the frontier and append to existing outputs "
+                         "(default: start fresh and overwrite them)")
+    ap.add_argument("--max-attempts", type=int, default=3,
+                    help="Runs in which a link may hit temporary fetch errors before it is given up as a miss")
+    ap.add_argument("--requeue", type=str, action="append", choices=["miss", "skip"], default=None,
+                    help="With --resume, retry links that ended as 'miss' or 'skip' in earlier runs "
+                         "(e.g. after the parser changes); may be repeated")
     args = ap.parse_args()
+    if args.requeue and not args.resume:
+        ap.error("--requeue needs --resume (without it the frontier is reset first)")
 
-    scrape_from_index(args.index, args.sleep, args.out_prefix, args.limit)
+    scrape_from_indexes(args.index, args.sleep, args.out_prefix, args.limit, args.frontier,
+                        args.max_attempts, args.requeue, args.resume)
 
 
 if __name__ == "__main__":